@@ -1,7 +1,7 @@
 # chat_api/asgi.py
 import os
 from channels.auth import AuthMiddlewareStack
-from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.routing import ProtocolTypeRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 
@@ -13,7 +13,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_api.settings')
 django_asgi_app = get_asgi_application()
 
 # Import routing after Django is initialized
-from conversations.routing import websocket_urlpatterns
+from conversations.routing import websocket_router
 
 application = ProtocolTypeRouter({
     # Django's ASGI application to handle traditional HTTP requests
@@ -22,7 +22,7 @@ application = ProtocolTypeRouter({
     # WebSocket handler
     "websocket": AllowedHostsOriginValidator(
         AuthMiddlewareStack(
-            URLRouter(websocket_urlpatterns)
+            websocket_router
         )
     ),
 })
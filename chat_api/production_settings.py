@@ -32,14 +32,14 @@ if os.getenv('DATABASE_URL'):
         'default': dj_database_url.parse(os.getenv('DATABASE_URL'))
     }
 
-# Production Redis settings
-if os.getenv('REDIS_URL'):
+# Production Redis settings (CHANNEL_REDIS_HOSTS comes from settings)
+if os.getenv('REDIS_SHARD_URLS') or os.getenv('REDIS_URL'):
     CHANNEL_LAYERS = {
         'default': {
             'BACKEND': 'channels_redis.core.RedisChannelLayer',
             'CONFIG': {
-                "hosts": [os.getenv('REDIS_URL')],
-                "capacity": 5000,  # Increased for production
+                "hosts": CHANNEL_REDIS_HOSTS,
+                "capacity": 10000,  # Increased for production
                 "expiry": 300,     # 5 minutes
                 "group_expiry": 86400,  # 24 hours
             },
@@ -237,19 +237,25 @@ else:
     }
 
 # Configuration des channels (WebSocket)
+# Comma-separated REDIS_SHARD_URLS spreads channel-layer groups across
+# several Redis nodes; channels_redis hashes group names onto the hosts.
+CHANNEL_REDIS_HOSTS = [
+    url.strip() for url in os.getenv('REDIS_SHARD_URLS', '').split(',') if url.strip()
+] or [os.getenv('REDIS_URL', 'redis://localhost:6379')]
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [os.getenv('REDIS_URL', 'redis://localhost:6379')],
-            "capacity": 1500,
+            "hosts": CHANNEL_REDIS_HOSTS,
+            "capacity": 10000,
             "expiry": 60,
         },
     },
 }
 
 # Fallback to in-memory layer if Redis is not available
-if not os.getenv('REDIS_URL'):
+if not os.getenv('REDIS_URL') and not os.getenv('REDIS_SHARD_URLS'):
     CHANNEL_LAYERS = {
         'default': {
             'BACKEND': 'channels.layers.InMemoryChannelLayer',
@@ -320,6 +326,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'conversations.consumers': {
+            'handlers': ['console'],
+            'level': 'DEBUG' if DEBUG else 'INFO',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -1,161 +1,381 @@
 # conversations/consumers.py
-import json
+import asyncio
+import logging
+import jwt
+from jwt.algorithms import get_default_algorithms
+import msgpack
+import orjson
+from cachetools import TTLCache
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth.models import AnonymousUser
 from .models import Conversation, Message
+from . import presence, typing_pubsub
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Process-local cache of authenticated users, keyed by user_id
+USER_CACHE_TTL = 60  # seconds
+USER_CACHE_MAX_SIZE = 10000
+_user_cache = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL)
+
+# Forged or malformed tokens per client IP. Each entry is a one-element
+# counter mutated in place, so it expires 60 s after the first failure
+# rather than 60 s after the latest one.
+AUTH_FAILURE_LIMIT = 20  # per window
+AUTH_FAILURE_WINDOW = 60  # seconds
+_auth_failures = TTLCache(maxsize=10000, ttl=AUTH_FAILURE_WINDOW)
+
+
+def _auth_failure_count(client_ip):
+    entry = _auth_failures.get(client_ip)
+    return entry[0] if entry is not None else 0
+
+
+def _record_auth_failure(client_ip):
+    if client_ip is None:
+        return
+    entry = _auth_failures.get(client_ip)
+    if entry is None:
+        _auth_failures[client_ip] = [1]
+    else:
+        entry[0] += 1
+
+_packer = msgpack.Packer(use_bin_type=True)
+
+_jwt_decode_kwargs = None
+
+
+def _get_jwt_decode_kwargs():
+    """
+    Return the jwt.decode() arguments for access tokens, built once per process.
+    
+    Asymmetric PEM keys are loaded into a cryptography key object so
+    PyJWT does not re-parse them on every handshake.
+    """
+    global _jwt_decode_kwargs
+    
+    if _jwt_decode_kwargs is None:
+        algorithm = jwt_settings.ALGORITHM
+        if algorithm.startswith('HS'):
+            key = jwt_settings.SIGNING_KEY
+        else:
+            key = get_default_algorithms()[algorithm].prepare_key(jwt_settings.VERIFYING_KEY)
+        
+        _jwt_decode_kwargs = {
+            'key': key,
+            'algorithms': [algorithm],
+            'audience': jwt_settings.AUDIENCE,
+            'issuer': jwt_settings.ISSUER,
+            'leeway': jwt_settings.LEEWAY,
+            'options': {'require': ['exp', jwt_settings.USER_ID_CLAIM]},
+        }
+    
+    return _jwt_decode_kwargs
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for chat functionality"""
     
+    # Fixed layout for per-connection state; the base classes still provide __dict__
+    __slots__ = (
+        'user', 'user_id', '_use_msgpack', '_in_general',
+        '_out_queue', '_flush_handle', '_flush_task', '_group_cache', '_joined',
+        '_typing_last', '_typing_idle', '_typing_tasks', '_presence_task',
+    )
+    
+    # Group event handlers bound onto the instance at connect, so Channels'
+    # per-event getattr() hits the instance dict instead of building a bound method
+    _GROUP_HANDLERS = (
+        'chat_message', 'new_message', 'typing_indicator',
+        'read_receipt', 'conversation_update',
+    )
+    
+    # Outbound group events are coalesced into a single frame
+    FLUSH_DELAY = 0.02  # seconds
+    FLUSH_MAX_EVENTS = 50
+    
+    # Inbound frames larger than this are refused (the server enforces it too)
+    MAX_FRAME_SIZE = 65536  # bytes
+    
+    # Typing indicators are forwarded at most once per window per conversation,
+    # and typing stops implicitly after an idle period
+    TYPING_DEBOUNCE = 2.0  # seconds
+    TYPING_IDLE_TIMEOUT = 3.0  # seconds
+    
+    # Joined on demand when the client sends subscribe_global_notifications
+    GENERAL_GROUP = 'general_chat_notifications'
+    
+    # Inbound message type -> handler method name
+    _HANDLERS = {
+        'ping': '_handle_ping',
+        'subscribe_global_notifications': '_subscribe_via_msg',
+        'join_conversation': '_join_via_msg',
+        'leave_conversation': '_leave_via_msg',
+        'new_message': 'handle_new_message',
+        'typing': 'handle_typing',
+        'read_receipt': 'handle_read_receipt',
+    }
+    
     async def connect(self):
         """Handle WebSocket connection"""
         self.user = None
         self.user_id = None
-        self.group_name = None
+        self._in_general = False
+        self._out_queue = []
+        self._flush_handle = None
+        self._flush_task = None
+        self._group_cache = {}
+        self._joined = set()
+        self._typing_last = {}
+        self._typing_idle = {}
+        self._typing_tasks = set()
+        self._presence_task = None
+        
+        # Decode before parsing: parse_qs on bytes fails on percent-encoded non-ASCII
+        query = parse_qs(self.scope.get('query_string', b'').decode('latin-1'))
+        
+        # Clients opt into MessagePack frames with ?encoding=msgpack
+        self._use_msgpack = query.get('encoding') == ['msgpack']
         
         # Get token from query string
-        token = self.scope.get('query_string', b'').decode().split('token=')[-1]
+        token_list = query.get('token')
+        token = token_list[0] if token_list else None
         
         if not token:
             await self.close(code=4001)  # Unauthorized
             return
         
+        # Refuse clients that keep failing authentication before verifying anything
+        client_ip = self._client_ip()
+        if _auth_failure_count(client_ip) >= AUTH_FAILURE_LIMIT:
+            logger.info("ChatConsumer: too many failed authentications from %s", client_ip)
+            await self.close(code=4008)  # Policy violation
+            return
+        
         # Authenticate user
         try:
             self.user = await self.authenticate_user(token)
             if self.user is None or isinstance(self.user, AnonymousUser):
-                print(f"❌ ChatConsumer: Authentication failed - Invalid user")
+                logger.debug("ChatConsumer: authentication failed - invalid user")
                 await self.close(code=4001)  # Unauthorized
                 return
             
             self.user_id = self.user.id
-            print(f"✅ ChatConsumer: User authenticated - {self.user.username} (ID: {self.user_id})")
+            logger.debug("ChatConsumer: user authenticated - %s (ID: %s)", self.user.username, self.user_id)
             
         except Exception as e:
-            print(f"❌ ChatConsumer: Authentication error - {e}")
+            logger.warning("ChatConsumer: authentication error - %s", e)
             await self.close(code=4001)  # Unauthorized
             return
         
-        # Join general notifications group
-        self.group_name = 'general_chat_notifications'
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
+        for name in self._GROUP_HANDLERS:
+            setattr(self, name, getattr(self, name))
         
         await self.accept()
-        print(f"✅ ChatConsumer: WebSocket connected for user {self.user.username}")
+        logger.debug("ChatConsumer: WebSocket connected for user %s", self.user.username)
         
         # Send welcome message
-        await self.send(text_data=json.dumps({
+        await self._send_payload({
             'type': 'connection_status',
             'status': 'connected',
             'user_id': self.user_id,
             'username': self.user.username,
-        }))
+        })
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
-        if self.group_name:
+        # Nothing may reach the socket once it is closing
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._out_queue = []
+        self._group_cache.clear()
+        
+        # Tell peers that announced typing indicators have stopped
+        for handle in self._typing_idle.values():
+            handle.cancel()
+        self._typing_idle.clear()
+        for conversation_id in list(self._typing_last):
+            await self._broadcast_typing(conversation_id, False)
+        self._typing_last.clear()
+        
+        if self._presence_task is not None:
+            self._presence_task.cancel()
+            self._presence_task = None
+        
+        for conversation_id in self._joined:
+            typing_pubsub.unsubscribe(conversation_id, self)
+            await presence.remove_subscriber(conversation_id, self.channel_name)
+        self._joined.clear()
+        
+        if self._in_general:
             await self.channel_layer.group_discard(
-                self.group_name,
+                self.GENERAL_GROUP,
                 self.channel_name
             )
-        print(f"🔌 ChatConsumer: User {self.user_id} disconnected (code: {close_code})")
+            self._in_general = False
+        logger.debug("ChatConsumer: user %s disconnected (code: %s)", self.user_id, close_code)
+    
+    def _client_ip(self):
+        """Client address as resolved by the ASGI server (proxy headers applied)"""
+        client = self.scope.get('client')
+        return client[0] if client else None
     
-    @database_sync_to_async
-    def authenticate_user(self, token):
+    async def authenticate_user(self, token):
         """Authenticate user using JWT token"""
         try:
-            # Validate token
-            UntypedToken(token)
+            # Validate signature and claims in a single decode
+            payload = jwt.decode(token, **_get_jwt_decode_kwargs())
+            if payload.get(jwt_settings.TOKEN_TYPE_CLAIM) != 'access':
+                raise jwt.InvalidTokenError('Token has wrong type')
             
-            # Get user from token
-            valid_data = JWTAuthentication().get_validated_token(token)
-            user_id = valid_data['user_id']
-            user = User.objects.get(id=user_id)
+            user_id = payload[jwt_settings.USER_ID_CLAIM]
+            
+            user = _user_cache.get(user_id)
+            if user is None:
+                user = await User.objects.only('id', 'username').aget(id=user_id)
+                _user_cache[user_id] = user
             
             return user
-        except (TokenError, InvalidToken) as e:
-            print(f"❌ ChatConsumer: Token error - {e}")
+        except jwt.DecodeError as e:
+            # Bad signature or garbage; expired or wrong-type tokens are normal reconnects
+            logger.debug("ChatConsumer: token error - %s", e)
+            _record_auth_failure(self._client_ip())
+            return None
+        except jwt.InvalidTokenError as e:
+            logger.debug("ChatConsumer: token error - %s", e)
             return None
         except User.DoesNotExist:
-            print(f"❌ ChatConsumer: User not found")
+            logger.info("ChatConsumer: user not found")
             return None
         except Exception as e:
-            print(f"❌ ChatConsumer: Authentication exception - {e}")
+            logger.warning("ChatConsumer: authentication exception - %s", e)
             return None
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming messages"""
+        if bytes_data is not None:
+            size = len(bytes_data)
+        elif text_data is not None:
+            # ASCII text is one byte per character; encode only when it is not
+            size = len(text_data) if text_data.isascii() else len(text_data.encode())
+        else:
+            await self.close(code=1003)  # Unsupported data
+            return
+        
+        if size > self.MAX_FRAME_SIZE:
+            await self.close(code=1009)  # Message too big
+            return
+        
+        # Binary frames carry MessagePack, text frames carry JSON
+        try:
+            if bytes_data is not None:
+                data = msgpack.unpackb(bytes_data, raw=False)
+            else:
+                data = orjson.loads(text_data)
+        except ValueError:
+            logger.debug("ChatConsumer: invalid payload received")
+            await self._send_payload({
+                'type': 'error',
+                'message': 'Invalid MessagePack format' if bytes_data is not None else 'Invalid JSON format',
+            })
+            return
+        
         try:
-            data = json.loads(text_data)
             message_type = data.get('type')
             
-            print(f"📥 ChatConsumer: Received message type '{message_type}' from user {self.user_id}")
-            
-            # Handle different message types
-            if message_type == 'ping':
-                await self.send(text_data=json.dumps({
-                    'type': 'pong',
-                    'timestamp': data.get('timestamp'),
-                }))
-            
-            elif message_type == 'join_conversation':
-                conversation_id = data.get('conversation_id')
-                await self.join_conversation(conversation_id)
-            
-            elif message_type == 'leave_conversation':
-                conversation_id = data.get('conversation_id')
-                await self.leave_conversation(conversation_id)
+            logger.debug("ChatConsumer: received message type %r from user %s", message_type, self.user_id)
             
-            elif message_type == 'new_message':
-                await self.handle_new_message(data)
+            # Dispatch to the handler registered for this message type
+            handler_name = self._HANDLERS.get(message_type)
+            if handler_name:
+                await getattr(self, handler_name)(data)
             
-            elif message_type == 'typing':
-                await self.handle_typing(data)
-            
-            elif message_type == 'read_receipt':
-                await self.handle_read_receipt(data)
-            
-        except json.JSONDecodeError:
-            print(f"❌ ChatConsumer: Invalid JSON received")
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': 'Invalid JSON format',
-            }))
         except Exception as e:
-            print(f"❌ ChatConsumer: Error processing message - {e}")
-            await self.send(text_data=json.dumps({
+            logger.warning("ChatConsumer: error processing message - %s", e)
+            await self._send_payload({
                 'type': 'error',
                 'message': str(e),
-            }))
+            })
+    
+    async def _handle_ping(self, data):
+        """Reply to a client ping"""
+        await self._send_payload({
+            'type': 'pong',
+            'timestamp': data.get('timestamp'),
+        })
+    
+    async def _subscribe_via_msg(self, data):
+        """Handle subscribe_global_notifications message"""
+        if self._in_general:
+            return
+        
+        await self.channel_layer.group_add(
+            self.GENERAL_GROUP,
+            self.channel_name
+        )
+        self._in_general = True
+        logger.debug("ChatConsumer: user %s subscribed to global notifications", self.user_id)
+    
+    async def _join_via_msg(self, data):
+        """Handle join_conversation message"""
+        await self.join_conversation(data.get('conversation_id'))
+    
+    async def _leave_via_msg(self, data):
+        """Handle leave_conversation message"""
+        await self.leave_conversation(data.get('conversation_id'))
+    
+    def _group(self, conversation_id):
+        """Return the group name for a conversation, cached while joined"""
+        group_name = self._group_cache.get(conversation_id)
+        if group_name is None:
+            group_name = f'chat_{conversation_id}'
+            if conversation_id in self._joined:
+                self._group_cache[conversation_id] = group_name
+        return group_name
     
     async def join_conversation(self, conversation_id):
         """Join conversation group for real-time updates"""
-        group_name = f'chat_{conversation_id}'
+        group_name = self._group(conversation_id)
         await self.channel_layer.group_add(
             group_name,
             self.channel_name
         )
-        print(f"✅ ChatConsumer: User {self.user_id} joined conversation {conversation_id}")
+        if conversation_id not in self._joined:
+            self._joined.add(conversation_id)
+            self._group_cache[conversation_id] = group_name
+            typing_pubsub.subscribe(conversation_id, self)
+            await presence.add_subscriber(conversation_id, self.channel_name)
+            if self._presence_task is None:
+                self._presence_task = asyncio.ensure_future(self._presence_heartbeat())
+        logger.debug("ChatConsumer: user %s joined conversation %s", self.user_id, conversation_id)
+    
+    async def _presence_heartbeat(self):
+        """Keep this connection's presence entries alive while it is open"""
+        while True:
+            await asyncio.sleep(presence.PRESENCE_REFRESH)
+            await presence.refresh_subscriber(list(self._joined), self.channel_name)
     
     async def leave_conversation(self, conversation_id):
         """Leave conversation group"""
-        group_name = f'chat_{conversation_id}'
+        group_name = self._group(conversation_id)
         await self.channel_layer.group_discard(
             group_name,
             self.channel_name
         )
-        print(f"🔌 ChatConsumer: User {self.user_id} left conversation {conversation_id}")
+        self._group_cache.pop(conversation_id, None)
+        if conversation_id in self._joined:
+            self._joined.discard(conversation_id)
+            typing_pubsub.unsubscribe(conversation_id, self)
+            await presence.remove_subscriber(conversation_id, self.channel_name)
+        logger.debug("ChatConsumer: user %s left conversation %s", self.user_id, conversation_id)
     
     async def handle_new_message(self, data):
         """Handle new message"""
@@ -168,28 +388,75 @@ class ChatConsumer(AsyncWebsocketConsumer):
         conversation_id = data.get('conversation_id')
         is_typing = data.get('is_typing', False)
         
-        # Broadcast typing indicator to conversation group
-        if conversation_id:
-            group_name = f'chat_{conversation_id}'
-            await self.channel_layer.group_send(
-                group_name,
-                {
-                    'type': 'typing_indicator',
-                    'user_id': self.user_id,
-                    'username': self.user.username,
-                    'is_typing': is_typing,
-                    'conversation_id': conversation_id,
-                }
-            )
+        if not conversation_id:
+            return
+        
+        if is_typing:
+            # Every keystroke pushes back the implicit "stopped typing"
+            self._schedule_typing_idle(conversation_id)
+            
+            now = asyncio.get_running_loop().time()
+            if now - self._typing_last.get(conversation_id, float('-inf')) < self.TYPING_DEBOUNCE:
+                return
+            self._typing_last[conversation_id] = now
+        else:
+            handle = self._typing_idle.pop(conversation_id, None)
+            if handle is not None:
+                handle.cancel()
+            # Nothing to clear if typing was never announced
+            if self._typing_last.pop(conversation_id, None) is None:
+                return
+        
+        await self._broadcast_typing(conversation_id, is_typing)
+    
+    def _schedule_typing_idle(self, conversation_id):
+        """(Re)arm the timer that announces the end of typing"""
+        handle = self._typing_idle.get(conversation_id)
+        if handle is not None:
+            handle.cancel()
+        
+        self._typing_idle[conversation_id] = asyncio.get_running_loop().call_later(
+            self.TYPING_IDLE_TIMEOUT,
+            self._typing_timed_out,
+            conversation_id
+        )
+    
+    def _typing_timed_out(self, conversation_id):
+        """Announce that typing stopped after the idle timeout"""
+        self._typing_idle.pop(conversation_id, None)
+        if self._typing_last.pop(conversation_id, None) is None:
+            return
+        
+        # Keep a reference until the broadcast completes
+        task = asyncio.ensure_future(self._broadcast_typing(conversation_id, False))
+        self._typing_tasks.add(task)
+        task.add_done_callback(self._typing_tasks.discard)
+    
+    async def _broadcast_typing(self, conversation_id, is_typing):
+        """Broadcast typing indicator to conversation group, unless nobody else is listening"""
+        if not await presence.has_other_subscribers(conversation_id, self.channel_name):
+            return
+        
+        event = {
+            'type': 'typing_indicator',
+            'user_id': self.user_id,
+            'username': self.user.username,
+            'is_typing': is_typing,
+            'conversation_id': conversation_id,
+        }
+        
+        # Prefer raw Redis pub/sub; fall back to the channel layer without Redis
+        if not await typing_pubsub.publish(conversation_id, event):
+            await self.channel_layer.group_send(self._group(conversation_id), event)
     
     async def handle_read_receipt(self, data):
         """Handle read receipt"""
         conversation_id = data.get('conversation_id')
         message_id = data.get('message_id')
         
-        # Broadcast read receipt to conversation group
-        if conversation_id and message_id:
-            group_name = f'chat_{conversation_id}'
+        # Broadcast read receipt to conversation group, unless nobody else is listening
+        if conversation_id and message_id and await presence.has_other_subscribers(conversation_id, self.channel_name):
+            group_name = self._group(conversation_id)
             await self.channel_layer.group_send(
                 group_name,
                 {
@@ -200,44 +467,112 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             )
     
+    # Outbound encoding
+    def _encode(self, payload):
+        """Serialize a payload in the connection's negotiated encoding"""
+        if self._use_msgpack:
+            return _packer.pack(payload)
+        return orjson.dumps(payload)
+    
+    async def _send_frame(self, frame):
+        """Send an encoded frame as binary (MessagePack) or text (JSON)"""
+        if self._use_msgpack:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame.decode())
+    
+    async def _send_payload(self, payload):
+        """Encode and send a single payload immediately"""
+        await self._send_frame(self._encode(payload))
+    
+    # Outbound batching
+    def _enqueue(self, payload):
+        """Queue an outbound event and schedule a flush"""
+        self._out_queue.append(self._encode(payload))
+        
+        # A running flush drains whatever is queued while it sends
+        if self._flush_task is not None:
+            return
+        
+        if len(self._out_queue) >= self.FLUSH_MAX_EVENTS:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.FLUSH_DELAY,
+                self._start_flush
+            )
+    
+    def _start_flush(self):
+        """Replace the pending flush timer with a running flush task"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._flush_task = asyncio.ensure_future(self._flush())
+    
+    async def _flush(self):
+        """Send queued events, coalescing each round into a single frame"""
+        try:
+            while self._out_queue:
+                events, self._out_queue = self._out_queue, []
+                await self._send_frame(self._batch_frame(events))
+        finally:
+            self._flush_task = None
+    
+    def _batch_frame(self, events):
+        """Build one frame out of encoded events"""
+        # A lone event goes out as-is; clients also accept a batch envelope
+        if len(events) == 1:
+            frame = events[0]
+        elif self._use_msgpack:
+            frame = (
+                _packer.pack_map_header(2)
+                + _packer.pack('type') + _packer.pack('batch')
+                + _packer.pack('events') + _packer.pack_array_header(len(events))
+                + b''.join(events)
+            )
+        else:
+            frame = b'{"type":"batch","events":[' + b','.join(events) + b']}'
+        
+        return frame
+    
     # Handler methods for group messages
     async def chat_message(self, event):
         """Handle chat_message from group"""
-        await self.send(text_data=json.dumps(event['message']))
+        self._enqueue(event['message'])
     
     async def new_message(self, event):
         """Handle new_message notification"""
-        await self.send(text_data=json.dumps({
+        self._enqueue({
             'type': 'new_message',
             'conversation_id': event.get('conversation_id'),
             'message': event.get('message'),
-        }))
+        })
     
     async def typing_indicator(self, event):
         """Handle typing indicator"""
-        await self.send(text_data=json.dumps({
+        self._enqueue({
             'type': 'typing_indicator',
             'conversation_id': event.get('conversation_id'),
             'user_id': event.get('user_id'),
             'username': event.get('username'),
             'is_typing': event.get('is_typing', False),
-        }))
+        })
     
     async def read_receipt(self, event):
         """Handle read receipt"""
-        await self.send(text_data=json.dumps({
+        self._enqueue({
             'type': 'read_receipt',
             'conversation_id': event.get('conversation_id'),
             'message_id': event.get('message_id'),
             'user_id': event.get('user_id'),
-        }))
+        })
     
     async def conversation_update(self, event):
         """Handle conversation update"""
-        await self.send(text_data=json.dumps({
+        # Queued like the other group events so it cannot overtake them
+        self._enqueue({
             'type': 'conversation_update',
             'conversation_id': event.get('conversation_id'),
             'action': event.get('action'),
             'data': event.get('data'),
-        }))
-
+        })
@@ -0,0 +1,82 @@
+# conversations/presence.py
+
+import logging
+import time
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Each conversation keeps a sorted set of subscribed channel names scored by
+# the time they last checked in. Live connections refresh their entries every
+# PRESENCE_REFRESH seconds; entries older than PRESENCE_TTL belong to dead
+# workers, are ignored by lookups and pruned on refresh.
+PRESENCE_TTL = 300  # seconds
+PRESENCE_REFRESH = PRESENCE_TTL / 3
+
+
+def _members_key(conversation_id):
+    return f'chat:{conversation_id}:members'
+
+
+async def add_subscriber(conversation_id, channel_name):
+    """Register a channel as subscribed to a conversation group"""
+    await refresh_subscriber([conversation_id], channel_name)
+
+
+async def refresh_subscriber(conversation_ids, channel_name):
+    """Mark a channel as still subscribed to the given conversations"""
+    client = get_redis()
+    if client is None or not conversation_ids:
+        return
+
+    now = time.time()
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for conversation_id in conversation_ids:
+                key = _members_key(conversation_id)
+                pipe.zremrangebyscore(key, '-inf', now - PRESENCE_TTL)
+                pipe.zadd(key, {channel_name: now})
+                pipe.expire(key, PRESENCE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Presence: could not refresh subscriber %s - %s", channel_name, e)
+
+
+async def remove_subscriber(conversation_id, channel_name):
+    """Forget a channel subscribed to a conversation group"""
+    client = get_redis()
+    if client is None:
+        return
+
+    try:
+        await client.zrem(_members_key(conversation_id), channel_name)
+    except Exception as e:
+        logger.warning("Presence: could not remove subscriber for %s - %s", conversation_id, e)
+
+
+async def has_other_subscribers(conversation_id, channel_name):
+    """
+    Return True if any live channel other than `channel_name` is subscribed.
+
+    Without Redis, or if Redis fails, this errs on the side of sending.
+    """
+    client = get_redis()
+    if client is None:
+        return True
+
+    key = _members_key(conversation_id)
+    cutoff = time.time() - PRESENCE_TTL
+    try:
+        # Read-only; stale entries are skipped here and pruned by the heartbeat
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.zcount(key, cutoff, '+inf')
+            pipe.zscore(key, channel_name)
+            count, own_score = await pipe.execute()
+    except Exception as e:
+        logger.warning("Presence: could not read subscribers for %s - %s", conversation_id, e)
+        return True
+
+    if own_score is not None and own_score >= cutoff:
+        count -= 1
+    return count > 0
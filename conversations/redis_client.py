@@ -0,0 +1,29 @@
+# conversations/redis_client.py
+
+import os
+
+# Upper bound on connections held by this process
+REDIS_MAX_CONNECTIONS = 64
+
+_redis = None
+
+
+def get_redis():
+    """
+    Return the shared async Redis client, or None when REDIS_URL is not set
+    """
+    global _redis
+
+    if _redis is None:
+        redis_url = os.getenv('REDIS_URL')
+        if not redis_url:
+            return None
+
+        import redis.asyncio as aioredis
+        pool = aioredis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=REDIS_MAX_CONNECTIONS,
+        )
+        _redis = aioredis.Redis(connection_pool=pool)
+
+    return _redis
@@ -1,12 +1,48 @@
 # conversations/routing.py
-from django.urls import re_path
 from . import consumers
 
-websocket_urlpatterns = [
-    # WebSocket URL for chat functionality
-    re_path(r'ws/chat/$', consumers.ChatConsumer.as_asgi()),
+# Shared ASGI application for both WebSocket routes
+_chat = consumers.ChatConsumer.as_asgi()
+
+
+class PrefixRouter:
+    """
+    Route WebSocket connections under /ws/ with a single dict lookup
+    
+    `routes` maps the path segment after 'ws' to an (application, params)
+    pair, where params names the integer segments that follow it. Matches
+    populate scope['url_route'] the same way URLRouter does.
+    """
     
-    # WebSocket URL for specific conversations
-    re_path(r'ws/conversations/(?P<conversation_id>\d+)/$', consumers.ChatConsumer.as_asgi()),
-]
+    def __init__(self, routes):
+        self.routes = routes
+    
+    async def __call__(self, scope, receive, send):
+        path = scope['path']
+        parts = path.strip('/').split('/')
+        
+        route = None
+        if path.endswith('/') and len(parts) >= 2 and parts[0] == 'ws':
+            route = self.routes.get(parts[1])
+        if route is None:
+            raise ValueError(f"No route found for path {path!r}.")
+        
+        application, params = route
+        values = parts[2:]
+        if len(values) != len(params) or not all(value.isascii() and value.isdigit() for value in values):
+            raise ValueError(f"No route found for path {path!r}.")
+        
+        scope = dict(scope, url_route={
+            'args': (),
+            'kwargs': {name: int(value) for name, value in zip(params, values)},
+        })
+        return await application(scope, receive, send)
+
 
+websocket_router = PrefixRouter({
+    # ws/chat/ - chat functionality
+    'chat': (_chat, ()),
+    
+    # ws/conversations/<conversation_id>/ - specific conversations
+    'conversations': (_chat, ('conversation_id',)),
+})
@@ -0,0 +1,469 @@
+# conversations/tests/test_chat_consumer.py
+
+import asyncio
+from datetime import timedelta
+from unittest import mock
+
+from cachetools import TTLCache
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from conversations import consumers, redis_client
+from conversations.consumers import ChatConsumer
+from conversations.routing import websocket_router
+
+User = get_user_model()
+
+
+class ChatConsumerTestCase(TestCase):
+    """Base test case for ChatConsumer"""
+
+    def setUp(self):
+        consumers._user_cache.clear()
+        consumers._auth_failures.clear()
+        redis_client._redis = None
+
+    def tearDown(self):
+        redis_client._redis = None
+
+    @database_sync_to_async
+    def create_user(self, username='testuser', email='test@example.com'):
+        """Create a test user"""
+        return User.objects.create_user(
+            username=username,
+            email=email,
+            password='testpass123'
+        )
+
+    def communicator(self, token, client_ip='10.0.0.1'):
+        """Build a communicator for /ws/chat/ coming from client_ip"""
+        communicator = WebsocketCommunicator(websocket_router, f'/ws/chat/?token={token}')
+        communicator.scope['client'] = (client_ip, 50000)
+        return communicator
+
+    async def connect_user(self, user):
+        """Connect a user and consume the welcome message"""
+        communicator = self.communicator(AccessToken.for_user(user))
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'connection_status')
+        return communicator
+
+    async def join(self, communicator, conversation_id):
+        """Join a conversation and wait until the consumer has processed it"""
+        await communicator.send_json_to({'type': 'join_conversation', 'conversation_id': conversation_id})
+        await communicator.send_json_to({'type': 'ping', 'timestamp': 1})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'pong')
+
+
+def bare_consumer():
+    """A ChatConsumer with the per-connection state connect() would set up"""
+    consumer = ChatConsumer()
+    consumer.user = None
+    consumer.user_id = None
+    consumer.channel_name = 'test.channel'
+    consumer._use_msgpack = False
+    consumer._in_general = False
+    consumer._out_queue = []
+    consumer._flush_handle = None
+    consumer._flush_task = None
+    consumer._group_cache = {}
+    consumer._joined = set()
+    consumer._typing_last = {}
+    consumer._typing_idle = {}
+    consumer._typing_tasks = set()
+    consumer._presence_task = None
+    return consumer
+
+
+def forged_token(user):
+    """An access token whose signature does not verify"""
+    header, payload, _ = str(AccessToken.for_user(user)).split('.')
+    return f'{header}.{payload}.{"A" * 43}'
+
+
+class TestOutboundBatching(ChatConsumerTestCase):
+    """Coalescing of outbound group events"""
+
+    def typing_event(self, user_id):
+        return {
+            'type': 'typing_indicator',
+            'conversation_id': 5,
+            'user_id': user_id,
+            'username': f'user{user_id}',
+            'is_typing': True,
+        }
+
+    async def test_burst_is_sent_as_batch_envelope(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+        await self.join(communicator, 5)
+
+        channel_layer = get_channel_layer()
+        await channel_layer.group_send('chat_5', self.typing_event(1))
+        await channel_layer.group_send('chat_5', self.typing_event(2))
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'batch')
+        self.assertEqual([event['user_id'] for event in response['events']], [1, 2])
+
+        await communicator.disconnect()
+
+    async def test_single_event_is_sent_unwrapped(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+        await self.join(communicator, 5)
+
+        await get_channel_layer().group_send('chat_5', self.typing_event(1))
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'typing_indicator')
+        self.assertEqual(response['user_id'], 1)
+
+        await communicator.disconnect()
+
+    async def test_pending_flush_is_dropped_on_disconnect(self):
+        consumer = bare_consumer()
+        sent = []
+
+        async def send(text_data=None, bytes_data=None):
+            sent.append(text_data)
+        consumer.send = send
+
+        consumer._enqueue({'type': 'ping'})
+        await consumer.disconnect(1000)
+        await asyncio.sleep(ChatConsumer.FLUSH_DELAY * 3)
+
+        self.assertEqual(sent, [])
+
+    async def test_running_flush_is_cancelled_on_disconnect(self):
+        consumer = bare_consumer()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        sent = []
+
+        async def send(text_data=None, bytes_data=None):
+            started.set()
+            await release.wait()
+            sent.append(text_data)
+        consumer.send = send
+
+        consumer._enqueue({'type': 'ping'})
+        await asyncio.wait_for(started.wait(), 1)
+
+        await consumer.disconnect(1000)
+        release.set()
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(sent, [])
+        self.assertIsNone(consumer._flush_task)
+
+    async def test_events_queued_during_flush_are_sent(self):
+        consumer = bare_consumer()
+        release = asyncio.Event()
+        sent = []
+
+        async def send(text_data=None, bytes_data=None):
+            await release.wait()
+            sent.append(text_data)
+        consumer.send = send
+
+        consumer._enqueue({'n': 1})
+        await asyncio.sleep(ChatConsumer.FLUSH_DELAY * 2)
+        consumer._enqueue({'n': 2})
+        release.set()
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(sent, ['{"n":1}', '{"n":2}'])
+        self.assertIsNone(consumer._flush_task)
+
+    async def test_conversation_update_keeps_group_order(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+        await self.join(communicator, 5)
+
+        channel_layer = get_channel_layer()
+        await channel_layer.group_send('chat_5', self.typing_event(1))
+        await channel_layer.group_send('chat_5', {
+            'type': 'conversation_update',
+            'conversation_id': 5,
+            'action': 'archived',
+        })
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'batch')
+        self.assertEqual(
+            [event['type'] for event in response['events']],
+            ['typing_indicator', 'conversation_update']
+        )
+
+        await communicator.disconnect()
+
+
+class TestUserCache(ChatConsumerTestCase):
+    """Process-local cache of authenticated users"""
+
+    async def test_cached_user_expires_after_ttl(self):
+        now = [0]
+        cache = TTLCache(maxsize=10, ttl=consumers.USER_CACHE_TTL, timer=lambda: now[0])
+        user = await self.create_user()
+        token = str(AccessToken.for_user(user))
+        consumer = bare_consumer()
+        consumer.scope = {'client': ('10.0.0.1', 50000)}
+
+        with mock.patch.object(consumers, '_user_cache', cache):
+            self.assertEqual((await consumer.authenticate_user(token)).username, 'testuser')
+
+            # Served from the cache until the entry expires
+            await User.objects.filter(id=user.id).aupdate(username='renamed')
+            self.assertEqual((await consumer.authenticate_user(token)).username, 'testuser')
+
+            now[0] = consumers.USER_CACHE_TTL + 1
+            self.assertEqual((await consumer.authenticate_user(token)).username, 'renamed')
+
+
+class TestQueryString(ChatConsumerTestCase):
+    """Parsing of the connection query string"""
+
+    async def test_percent_encoded_non_ascii_parameter(self):
+        user = await self.create_user()
+        token = AccessToken.for_user(user)
+        communicator = WebsocketCommunicator(websocket_router, f'/ws/chat/?lang=%C3%A9&token={token}')
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.disconnect()
+
+    async def test_missing_token_is_rejected(self):
+        communicator = WebsocketCommunicator(websocket_router, '/ws/chat/?lang=%C3%A9')
+
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+
+
+class TestGroupCache(ChatConsumerTestCase):
+    """Per-connection group name cache"""
+
+    async def test_only_joined_conversations_are_cached(self):
+        consumer = bare_consumer()
+        consumer.channel_layer = get_channel_layer()
+
+        self.assertEqual(consumer._group(99), 'chat_99')
+        self.assertEqual(consumer._group_cache, {})
+
+        await consumer.join_conversation(5)
+        self.assertEqual(consumer._group_cache, {5: 'chat_5'})
+
+        await consumer.leave_conversation(5)
+        self.assertEqual(consumer._group_cache, {})
+
+        await consumer.disconnect(1000)
+
+
+class TestAuthentication(ChatConsumerTestCase):
+    """JWT validation on connect"""
+
+    async def test_access_token_connects(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+        await communicator.disconnect()
+
+    async def test_refresh_token_rejected(self):
+        user = await self.create_user()
+        communicator = self.communicator(RefreshToken.for_user(user))
+
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+
+    async def test_token_for_unknown_user_rejected(self):
+        user = await self.create_user()
+        token = AccessToken.for_user(user)
+        token['user_id'] = user.id + 1000
+
+        connected, code = await self.communicator(token).connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+
+
+class TestAuthThrottle(ChatConsumerTestCase):
+    """Lockout of clients that keep sending forged tokens"""
+
+    # FORWARDED_ALLOW_IPS in render.yaml and .env.example
+    TRUSTED_PROXIES = '10.0.0.0/8,172.16.0.0/12,192.168.0.0/16'
+
+    def proxied(self, token, x_forwarded_for):
+        """A communicator reaching uvicorn's proxy-header handling through the load balancer"""
+        communicator = WebsocketCommunicator(
+            ProxyHeadersMiddleware(websocket_router, trusted_hosts=self.TRUSTED_PROXIES),
+            f'/ws/chat/?token={token}',
+            headers=[(b'x-forwarded-for', x_forwarded_for.encode())]
+        )
+        communicator.scope['client'] = ('10.1.2.3', 40000)
+        return communicator
+
+    async def test_forged_tokens_lock_out_only_that_client(self):
+        user = await self.create_user()
+
+        for _ in range(consumers.AUTH_FAILURE_LIMIT):
+            connected, code = await self.communicator(forged_token(user)).connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4001)
+
+        # Even a valid token is refused from the offending address
+        connected, code = await self.communicator(AccessToken.for_user(user)).connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4008)
+
+        # Other clients are unaffected
+        communicator = self.communicator(AccessToken.for_user(user), client_ip='10.0.0.2')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+    async def test_spoofed_forwarded_for_neither_evades_nor_frames(self):
+        user = await self.create_user()
+        attacker, victim = '203.0.113.7', '198.51.100.9'
+
+        # The client controls the leftmost entries; the proxy appends the real address
+        for i in range(consumers.AUTH_FAILURE_LIMIT):
+            spoofed = victim if i % 2 else f'192.0.2.{i}'
+            connected, code = await self.proxied(forged_token(user), f'{spoofed}, {attacker}').connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4001)
+
+        connected, code = await self.proxied(AccessToken.for_user(user), f'192.0.2.200, {attacker}').connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4008)
+
+        communicator = self.proxied(AccessToken.for_user(user), victim)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+    async def test_expired_tokens_are_not_counted(self):
+        user = await self.create_user()
+        expired = AccessToken.for_user(user)
+        expired.set_exp(lifetime=-timedelta(seconds=1))
+
+        for _ in range(consumers.AUTH_FAILURE_LIMIT + 5):
+            connected, code = await self.communicator(expired).connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4001)
+
+        communicator = await self.connect_user(user)
+        await communicator.disconnect()
+
+    def test_failure_window_starts_at_first_failure(self):
+        now = [0]
+        failures = TTLCache(maxsize=10, ttl=consumers.AUTH_FAILURE_WINDOW, timer=lambda: now[0])
+
+        with mock.patch.object(consumers, '_auth_failures', failures):
+            consumers._record_auth_failure('10.0.0.1')
+            now[0] = 50
+            consumers._record_auth_failure('10.0.0.1')
+            self.assertEqual(consumers._auth_failure_count('10.0.0.1'), 2)
+
+            # Later failures do not extend the window
+            now[0] = consumers.AUTH_FAILURE_WINDOW + 1
+            self.assertEqual(consumers._auth_failure_count('10.0.0.1'), 0)
+
+
+class TestReceiveLimits(ChatConsumerTestCase):
+    """Inbound frame validation"""
+
+    async def test_oversized_multibyte_text_is_closed(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+
+        # Under the limit in characters, over it in UTF-8 bytes
+        await communicator.send_to(text_data='é' * (ChatConsumer.MAX_FRAME_SIZE // 2 + 1))
+
+        output = await communicator.receive_output()
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 1009})
+
+    async def test_oversized_binary_frame_is_closed(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+
+        await communicator.send_to(bytes_data=b'\x00' * (ChatConsumer.MAX_FRAME_SIZE + 1))
+
+        output = await communicator.receive_output()
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 1009})
+
+    async def test_frame_without_data_is_closed(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+
+        await communicator.send_input({'type': 'websocket.receive', 'text': None, 'bytes': None})
+
+        output = await communicator.receive_output()
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 1003})
+
+
+@mock.patch.object(ChatConsumer, 'TYPING_IDLE_TIMEOUT', 0.1)
+class TestTypingDebounce(ChatConsumerTestCase):
+    """Debouncing of typing indicators"""
+
+    def typing(self, is_typing):
+        return {'type': 'typing', 'conversation_id': 7, 'is_typing': is_typing}
+
+    async def test_keystrokes_are_debounced_and_idle_stops_typing(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+        await self.join(communicator, 7)
+
+        for _ in range(3):
+            await communicator.send_json_to(self.typing(True))
+
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['type'], 'typing_indicator')
+        self.assertTrue(response['is_typing'])
+
+        # No further typing=true, then typing=false once the idle timeout passes
+        response = await communicator.receive_json_from(timeout=1)
+        self.assertEqual(response['type'], 'typing_indicator')
+        self.assertFalse(response['is_typing'])
+
+        self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+        await communicator.disconnect()
+
+    async def test_stop_without_announced_typing_is_not_forwarded(self):
+        user = await self.create_user()
+        communicator = await self.connect_user(user)
+        await self.join(communicator, 7)
+
+        await communicator.send_json_to(self.typing(False))
+
+        self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+        await communicator.disconnect()
+
+    async def test_disconnect_stops_announced_typing(self):
+        typist = await self.create_user()
+        reader = await self.create_user('reader', 'reader@example.com')
+        typist_communicator = await self.connect_user(typist)
+        reader_communicator = await self.connect_user(reader)
+        await self.join(typist_communicator, 7)
+        await self.join(reader_communicator, 7)
+
+        await typist_communicator.send_json_to(self.typing(True))
+        response = await reader_communicator.receive_json_from()
+        self.assertTrue(response['is_typing'])
+
+        await typist_communicator.disconnect()
+
+        response = await reader_communicator.receive_json_from()
+        self.assertEqual(response['user_id'], typist.id)
+        self.assertFalse(response['is_typing'])
+
+        await reader_communicator.disconnect()
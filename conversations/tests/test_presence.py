@@ -0,0 +1,60 @@
+# conversations/tests/test_presence.py
+
+import time
+
+import fakeredis
+from django.test import TestCase
+
+from conversations import presence, redis_client
+
+
+class TestPresence(TestCase):
+    """Redis-backed subscriber tracking"""
+
+    def setUp(self):
+        redis_client._redis = fakeredis.FakeAsyncRedis()
+
+    def tearDown(self):
+        redis_client._redis = None
+
+    async def test_heartbeat_recovers_from_expired_key(self):
+        await presence.add_subscriber(1, 'a')
+
+        # A's key expires while A idles; its heartbeat re-registers it
+        await redis_client._redis.delete('chat:1:members')
+        await presence.refresh_subscriber([1], 'a')
+        await presence.add_subscriber(1, 'b')
+
+        self.assertTrue(await presence.has_other_subscribers(1, 'a'))
+        self.assertTrue(await presence.has_other_subscribers(1, 'b'))
+
+    async def test_left_members_are_not_counted(self):
+        await presence.add_subscriber(1, 'a')
+        await presence.add_subscriber(1, 'b')
+
+        await presence.remove_subscriber(1, 'b')
+        self.assertFalse(await presence.has_other_subscribers(1, 'a'))
+
+    async def test_stale_members_are_ignored_and_pruned_on_refresh(self):
+        await presence.add_subscriber(1, 'a')
+        stale = time.time() - presence.PRESENCE_TTL - 1
+        await redis_client._redis.zadd('chat:1:members', {'dead': stale})
+
+        # A member from a dead worker does not count as a listener
+        self.assertFalse(await presence.has_other_subscribers(1, 'a'))
+
+        # The lookup leaves the set alone; the heartbeat prunes it
+        self.assertIsNotNone(await redis_client._redis.zscore('chat:1:members', 'dead'))
+        await presence.refresh_subscriber([1], 'a')
+        self.assertIsNone(await redis_client._redis.zscore('chat:1:members', 'dead'))
+
+    async def test_lookup_without_redis_always_sends(self):
+        redis_client._redis = None
+        self.assertTrue(await presence.has_other_subscribers(1, 'a'))
+
+    async def test_lookup_with_redis_down_always_sends(self):
+        server = fakeredis.FakeServer()
+        server.connected = False
+        redis_client._redis = fakeredis.FakeAsyncRedis(server=server)
+
+        self.assertTrue(await presence.has_other_subscribers(1, 'a'))
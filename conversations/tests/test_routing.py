@@ -0,0 +1,50 @@
+# conversations/tests/test_routing.py
+
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from conversations.routing import PrefixRouter, websocket_router
+from conversations.tests.test_chat_consumer import ChatConsumerTestCase
+
+
+class TestPrefixRouter(TestCase):
+    """Static WebSocket routing"""
+
+    def setUp(self):
+        self.scopes = []
+
+        async def app(scope, receive, send):
+            self.scopes.append(scope)
+
+        self.router = PrefixRouter({
+            'chat': (app, ()),
+            'conversations': (app, ('conversation_id',)),
+        })
+
+    async def test_routes_populate_url_route(self):
+        await self.router({'path': '/ws/chat/'}, None, None)
+        await self.router({'path': '/ws/conversations/12/'}, None, None)
+
+        self.assertEqual(self.scopes[0]['url_route'], {'args': (), 'kwargs': {}})
+        self.assertEqual(self.scopes[1]['url_route'], {'args': (), 'kwargs': {'conversation_id': 12}})
+
+    async def test_unmatched_paths_raise(self):
+        for path in ['/ws/chat', '/ws/other/', '/ws/conversations/', '/ws/conversations/x/',
+                     '/ws/conversations/٣/', '/ws/conversations/²/', '/api/chat/']:
+            with self.assertRaises(ValueError, msg=path):
+                await self.router({'path': path}, None, None)
+
+
+class TestWebsocketRouter(ChatConsumerTestCase):
+    """The project's route table"""
+
+    async def test_conversation_path_reaches_consumer(self):
+        user = await self.create_user()
+        token = AccessToken.for_user(user)
+        communicator = WebsocketCommunicator(websocket_router, f'/ws/conversations/12/?token={token}')
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.disconnect()
@@ -0,0 +1,69 @@
+# conversations/tests/test_typing_pubsub.py
+
+import asyncio
+from unittest import mock
+
+import fakeredis
+from django.test import TestCase
+
+from conversations import redis_client, typing_pubsub
+
+
+class FakeConsumer:
+    """Collects the typing indicators delivered to it"""
+
+    def __init__(self):
+        self.received = asyncio.Queue()
+
+    async def typing_indicator(self, event):
+        await self.received.put(event)
+
+
+@mock.patch.object(typing_pubsub, 'LISTENER_RETRY_MIN', 0.01)
+class TestTypingPubSub(TestCase):
+    """Redis pub/sub delivery of typing indicators"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        redis_client._redis = fakeredis.FakeAsyncRedis(server=self.server)
+
+    def tearDown(self):
+        if typing_pubsub._listener_task is not None:
+            typing_pubsub._listener_task.cancel()
+            typing_pubsub._listener_task = None
+        typing_pubsub._subscribers.clear()
+        redis_client._redis = None
+
+    async def publish_until_received(self, consumer, conversation_id, event):
+        """Publish until the listener delivers the event (it subscribes asynchronously)"""
+        for _ in range(50):
+            await typing_pubsub.publish(conversation_id, event)
+            try:
+                return await asyncio.wait_for(consumer.received.get(), 0.05)
+            except asyncio.TimeoutError:
+                continue
+        self.fail('listener did not deliver the event')
+
+    async def test_event_reaches_subscribed_consumer_only(self):
+        consumer, other = FakeConsumer(), FakeConsumer()
+        typing_pubsub.subscribe(3, consumer)
+        typing_pubsub.subscribe(4, other)
+
+        event = {'type': 'typing_indicator', 'conversation_id': 3, 'is_typing': True}
+        self.assertEqual(await self.publish_until_received(consumer, 3, event), event)
+        self.assertTrue(other.received.empty())
+
+    async def test_listener_recovers_after_redis_outage(self):
+        consumer = FakeConsumer()
+
+        self.server.connected = False
+        typing_pubsub.subscribe(3, consumer)
+        await asyncio.sleep(0.05)
+        self.server.connected = True
+
+        event = {'type': 'typing_indicator', 'conversation_id': 3, 'is_typing': True}
+        self.assertEqual(await self.publish_until_received(consumer, 3, event), event)
+
+    async def test_publish_without_redis_falls_back(self):
+        redis_client._redis = None
+        self.assertFalse(await typing_pubsub.publish(3, {'type': 'typing_indicator'}))
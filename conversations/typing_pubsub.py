@@ -0,0 +1,117 @@
+# conversations/typing_pubsub.py
+
+import asyncio
+import logging
+
+import orjson
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Typing indicators are ephemeral, so they skip the channel layer and go
+# straight through Redis PUBLISH. One PSUBSCRIBE per process fans them
+# out to the local consumers registered for each conversation.
+CHANNEL_PREFIX = 'chat_typing:'
+
+# Reconnect backoff for the listener
+LISTENER_RETRY_MIN = 0.5  # seconds
+LISTENER_RETRY_MAX = 30  # seconds
+
+_subscribers = {}
+_listener_task = None
+
+
+def subscribe(conversation_id, consumer):
+    """Register a consumer for typing indicators of a conversation"""
+    if get_redis() is None:
+        return
+
+    _subscribers.setdefault(str(conversation_id), set()).add(consumer)
+    _ensure_listener()
+
+
+def unsubscribe(conversation_id, consumer):
+    """Stop delivering typing indicators of a conversation to a consumer"""
+    key = str(conversation_id)
+    consumers = _subscribers.get(key)
+    if consumers is None:
+        return
+
+    consumers.discard(consumer)
+    if not consumers:
+        del _subscribers[key]
+
+
+async def publish(conversation_id, event):
+    """
+    Publish a typing indicator event.
+
+    Returns False when Redis is unavailable so the caller can fall back
+    to the channel layer.
+    """
+    client = get_redis()
+    if client is None:
+        return False
+
+    try:
+        await client.publish(f'{CHANNEL_PREFIX}{conversation_id}', orjson.dumps(event))
+    except Exception as e:
+        logger.warning("Typing pub/sub: publish failed for %s - %s", conversation_id, e)
+        return False
+
+    return True
+
+
+def _ensure_listener():
+    global _listener_task
+
+    if _listener_task is None or _listener_task.done():
+        _listener_task = asyncio.ensure_future(_listen())
+
+
+async def _listen():
+    """
+    Receive typing indicators from Redis and hand them to local consumers.
+
+    Connection failures are retried with exponential backoff, so the
+    listener outlives Redis restarts.
+    """
+    delay = LISTENER_RETRY_MIN
+    while True:
+        pubsub = get_redis().pubsub()
+        try:
+            await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+            delay = LISTENER_RETRY_MIN
+            async for message in pubsub.listen():
+                if message['type'] == 'pmessage':
+                    await _dispatch(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Typing pub/sub: listener error - %s; retrying in %ss", e, delay)
+        finally:
+            try:
+                # aclose() replaced reset() in redis 5.0.1
+                close = getattr(pubsub, 'aclose', None) or pubsub.reset
+                await close()
+            except Exception:
+                pass
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, LISTENER_RETRY_MAX)
+
+
+async def _dispatch(message):
+    """Deliver one published typing indicator to the local consumers"""
+    conversation_id = message['channel'].decode()[len(CHANNEL_PREFIX):]
+    consumers = _subscribers.get(conversation_id)
+    if not consumers:
+        return
+
+    event = orjson.loads(message['data'])
+    for consumer in list(consumers):
+        try:
+            await consumer.typing_indicator(event)
+        except Exception as e:
+            logger.warning("Typing pub/sub: delivery failed for %s - %s", conversation_id, e)
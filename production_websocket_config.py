@@ -3,12 +3,12 @@ Production WebSocket Configuration for FortiFun
 Optimized for free hosting platforms
 """
 import os
-from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.routing import ProtocolTypeRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 from django.urls import path
-from conversations.routing import websocket_urlpatterns
+from conversations.routing import websocket_router
 
 # Django ASGI application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_api.settings')
@@ -19,7 +19,7 @@ application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
         AuthMiddlewareStack(
-            URLRouter(websocket_urlpatterns)
+            websocket_router
         )
     ),
 })
@@ -13,6 +13,16 @@ echo "Skipping user seeding - accounts app is disabled"
 # Collect static files
 python manage.py collectstatic --noinput
 
-# Start the server with daphne (ASGI) for WebSocket support
+# Start the server with uvicorn (ASGI) for WebSocket support
+# uvloop and httptools replace the pure-Python event loop and HTTP parser
+# Per-message deflate is off and the inbound queue is kept short so idle
+# connections do not each hold zlib state and large buffers
+# X-Forwarded-For is trusted only from FORWARDED_ALLOW_IPS (uvicorn reads it
+# from the environment); set it to the load balancer's addresses or CIDRs so
+# scope['client'] is the rightmost untrusted hop, i.e. the real user. Never
+# use "*": uvicorn then takes the leftmost entry, which the client controls
 # Use PORT environment variable injected by Render
-daphne -b 0.0.0.0 -p $PORT chat_api.asgi:application
+uvicorn chat_api.asgi:application \
+    --host 0.0.0.0 --port $PORT --proxy-headers \
+    --loop uvloop --http httptools --ws websockets \
+    --ws-per-message-deflate false --ws-max-queue 8 --ws-max-size 65536